@@ -1,6 +1,7 @@
 import ssl
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool
 from app.config import get_settings
 
 settings = get_settings()
@@ -18,6 +19,23 @@ engine = create_async_engine(
     connect_args={"ssl": ssl_context},
 )
 
+# Engine for the one-shot scripts in migrations/. Each script checks out a
+# connection or two and every statement runs once, so pooling, pre-ping
+# SELECT 1s, reset-on-return ROLLBACKs and asyncpg's prepared statement caches
+# are all pure overhead there.
+migration_engine = create_async_engine(
+    settings.async_database_url,
+    echo=settings.environment == "development",
+    poolclass=NullPool,
+    pool_pre_ping=False,
+    pool_reset_on_return=None,
+    connect_args={
+        "ssl": ssl_context,
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+    },
+)
+
 # Session factory
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -1,6 +1,6 @@
 """SQLAlchemy models for meal planning."""
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Date, Enum
+from sqlalchemy import Column, String, DateTime, ForeignKey, Date, Enum, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -24,7 +24,7 @@ class MealPlanEntry(Base):
     __tablename__ = "meal_plan_entries"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(String(64), nullable=False, index=True)
+    user_id = Column(String(64), nullable=False)
     date = Column(Date, nullable=False, index=True)
     meal_type = Column(String(20), nullable=False)  # breakfast, lunch, dinner, snack
     recipe_id = Column(UUID(as_uuid=True), ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False)
@@ -40,6 +40,10 @@ class MealPlanEntry(Base):
     __table_args__ = (
         # No unique constraint - allow multiple recipes per meal slot if desired
         # Users might want 2 side dishes for dinner
+        # Covers per-user date-range lookups ordered by date and meal slot
+        Index("idx_meal_plan_entries_user_date_meal", "user_id", "date", "meal_type"),
+        # Lets ON DELETE CASCADE from recipes find entries without a full scan
+        Index("idx_meal_plan_entries_recipe_id", "recipe_id"),
         {},
     )
 
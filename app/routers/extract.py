@@ -47,8 +47,10 @@ def _compute_total_minutes(extracted: dict) -> Optional[int]:
     if not extracted:
         return None
     
-    times = extracted.get("times") or {}
-    total_time = times.get("total") or extracted.get("total_time")
+    times = extracted.get("times")
+    total_time = (
+        times.get("total") if isinstance(times, dict) else None
+    ) or extracted.get("total_time")
     
     if total_time:
         return _parse_time_to_minutes(str(total_time))
@@ -791,8 +791,10 @@ def compute_total_minutes(extracted: dict) -> Optional[int]:
         return None
     
     # Try to get total time from extracted data
-    times = extracted.get("times") or {}
-    total_time = times.get("total") or extracted.get("total_time")
+    times = extracted.get("times")
+    total_time = (
+        times.get("total") if isinstance(times, dict) else None
+    ) or extracted.get("total_time")
     
     if total_time:
         return parse_time_to_minutes(str(total_time))
@@ -11,9 +11,14 @@ import json
 import re
 import sentry_sdk
 from dataclasses import dataclass
+from functools import lru_cache
+from html import unescape
 from typing import Optional, Any
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
+import lxml.html
+
+from app.services.llm_client import llm_service
 
 try:
     import extruct
@@ -93,6 +98,146 @@ def _log_extraction_failure(
     print(f"📡 Logged to Sentry: {error_type} for {domain}")
 
 
+# Titles the AI returns when it couldn't find a real recipe
+_PLACEHOLDER_TITLES = frozenset({'recipe title', 'untitled', 'recipe', 'title', 'no title', 'unknown'})
+
+# Units recognized by _parse_ingredient_string (kept in sync with its unit regex)
+_INGREDIENT_UNITS = frozenset({
+    'cup', 'cups', 'tablespoon', 'tablespoons', 'tbsp', 'teaspoon', 'teaspoons', 'tsp',
+    'pound', 'pounds', 'lb', 'lbs', 'ounce', 'ounces', 'oz', 'gram', 'grams', 'g', 'kg',
+    'ml', 'liter', 'liters', 'l', 'piece', 'pieces', 'clove', 'cloves', 'can', 'cans',
+    'package', 'packages', 'bunch', 'bunches', 'pinch', 'dash', 'handful', 'stick', 'sticks',
+})
+
+# Open Graph image meta tag with property before content (the common layout)
+_OG_IMAGE_RE = re.compile(
+    r'<meta[^>]+property=["\']og:image["\'][^>]+content=["\']([^"\']+)',
+    re.IGNORECASE,
+)
+
+# Meta tags to fall back on for a page image, in order of preference
+_META_IMAGE_XPATHS = (
+    '//meta[@property="og:image"]/@content',
+    '//meta[@name="twitter:image"]/@content',
+)
+
+# Class/id patterns for locating recipe sections in page HTML
+_INGREDIENT_RE = re.compile(r'ingredient', re.I)
+_STEPS_CLASS_RE = re.compile(r'prep|step|instruction|direction|method', re.I)
+_DIRECTIONS_CLASS_RE = re.compile(r'direction|instruction|preparation', re.I)
+_DIRECTIONS_ID_RE = re.compile(r'direction|instruction|step', re.I)
+_MAIN_CONTENT_CLASS_RE = re.compile(r'recipe|content|post', re.I)
+_SERVINGS_RE = re.compile(r'(serves?|yields?|makes?)\s*:?\s*\d+', re.I)
+
+@lru_cache(maxsize=512)
+def _parse_iso_duration_cached(duration: str) -> str:
+    """
+    Parse ISO 8601 duration (PT30M) to human readable (30 min).
+    
+    Cached because prep/cook/total times repeat constantly across recipes.
+    """
+    if not duration:
+        return ""
+    
+    # Already human readable
+    if not duration.startswith('P'):
+        return duration
+    
+    # Single pass over the designators (e.g. P1DT2H30M). Components are kept
+    # as written, so zeros still display ("PT0M" -> "0 min"); unsupported ones
+    # (years, weeks, fractions) end the scan.
+    days = hours = minutes = seconds = None
+    number = ''
+    for ch in duration[1:]:
+        if '0' <= ch <= '9':
+            number += ch
+        elif ch == 'T' and not number:
+            continue
+        elif number and ch in 'DHMS':
+            if ch == 'D':
+                days = number
+            elif ch == 'H':
+                hours = number
+            elif ch == 'M':
+                minutes = number
+            else:
+                seconds = number
+            number = ''
+        else:
+            break
+    
+    parts = []
+    if days is not None:
+        parts.append(f"{days} day{'s' if int(days) > 1 else ''}")
+    if hours is not None:
+        parts.append(f"{hours} hour{'s' if int(hours) > 1 else ''}")
+    if minutes is not None:
+        parts.append(f"{minutes} min")
+    if seconds is not None and minutes is None:  # Only show seconds if no minutes
+        parts.append(f"{seconds} sec")
+    
+    return ' '.join(parts) if parts else duration
+
+
+# Prompt for AI extraction from page content (filled via str.format)
+_RECIPE_PROMPT_TEMPLATE = """Extract the recipe from this webpage content. Return a JSON object with the recipe details.
+
+URL: {url}
+
+WEBPAGE CONTENT:
+{content}
+
+Return a JSON object with these fields:
+{{
+  "title": "Recipe title",
+  "description": "Brief description",
+  "servings": number or null,
+  "times": {{
+    "prep": "prep time string",
+    "cook": "cook time string", 
+    "total": "total time string"
+  }},
+  "components": [
+    {{
+      "name": "Component/section name (e.g., 'Chicken Marinade', 'Sauce', 'Main Dish') or empty string if no sections",
+      "ingredients": [
+        {{"name": "ingredient name", "quantity": "amount", "unit": "unit", "notes": "optional notes", "original": "full original text"}}
+      ],
+      "steps": ["step 1 text", "step 2 text"]
+    }}
+  ],
+  "tags": ["tag1", "tag2"],
+  "mealTypes": ["breakfast", "lunch", "dinner", "snack", "dessert"],
+  "nutrition": {{
+    "perServing": {{"calories": number, "protein": number, "carbs": number, "fat": number, "fiber": number, "sugar": number, "sodium": number}}
+  }},
+  "notes": "{notes}",
+  "location": "{location}"
+}}
+
+IMPORTANT:
+- If the recipe has SECTIONS (like "Chicken Marinade:", "Sauce:", "For the filling:"), create SEPARATE components for each section
+- Each component should have its own name, ingredients, and steps
+- If there are no clear sections, use a single component with an empty name
+- Extract ALL ingredients mentioned, grouped by their section
+- Extract ALL steps in order, grouped by their section
+- Use reasonable estimates for times if not explicitly stated
+- NUTRITION: If the website provides nutrition info, use it. If NOT provided, ESTIMATE the nutrition per serving based on the ingredients and typical values. Always provide nutrition estimates - never leave it empty.
+- Only return valid JSON, no explanation"""
+
+# Recipe pages rarely need more than this for a good extraction
+_AI_CONTENT_MAX_CHARS = 6000
+_AI_CONTENT_MIN_CHARS = 4000
+
+
+def _truncate_for_prompt(content: str) -> str:
+    """Trim content for the AI prompt, cutting at a line break when one is close to the limit."""
+    if len(content) <= _AI_CONTENT_MAX_CHARS:
+        return content
+    end = content.rfind('\n', 0, _AI_CONTENT_MAX_CHARS)
+    return content[:end if end > _AI_CONTENT_MIN_CHARS else _AI_CONTENT_MAX_CHARS]
+
+
 class WebsiteService:
     """Service for extracting recipes from websites."""
     
@@ -739,16 +884,18 @@ class WebsiteService:
             }
         }
         
-        # Get author
+        # Get author - JSON-LD values are plain built-in types, so compare types
+        # directly instead of walking an isinstance chain
         if jsonld.get('author'):
             author = jsonld['author']
-            if isinstance(author, dict):
+            author_type = type(author)
+            if author_type is dict:
                 recipe['author'] = author.get('name', '')
-            elif isinstance(author, str):
+            elif author_type is str:
                 recipe['author'] = author
-            elif isinstance(author, list) and author:
+            elif author_type is list:
                 first_author = author[0]
-                if isinstance(first_author, dict):
+                if type(first_author) is dict:
                     recipe['author'] = first_author.get('name', '')
                 else:
                     recipe['author'] = str(first_author)
@@ -781,13 +928,22 @@ class WebsiteService:
             quantity = qty_match.group(1).strip()
             remaining = ing_str[qty_match.end():].strip()
             
-            # Extract unit
-            unit_match = re.match(unit_pattern, remaining, re.IGNORECASE)
-            if unit_match:
-                unit = unit_match.group(1).strip()
-                name = remaining[unit_match.end():].strip()
+            # Extract unit - plain "2 cups flour" lines resolve with a set lookup,
+            # anything else (tabs, odd spacing) goes through the regex
+            token, sep, rest = remaining.partition(' ')
+            if sep and token[-1:] in ('s', 'S') and token[:-1].lower() in _INGREDIENT_UNITS:
+                unit = token[:-1]
+                name = rest.strip()
+            elif sep and token.lower() in _INGREDIENT_UNITS:
+                unit = token
+                name = rest.strip()
             else:
-                name = remaining
+                unit_match = re.match(unit_pattern, remaining, re.IGNORECASE)
+                if unit_match:
+                    unit = unit_match.group(1).strip()
+                    name = remaining[unit_match.end():].strip()
+                else:
+                    name = remaining
         
         # Clean up name - remove trailing commas and notes in parentheses for name
         name_clean = re.sub(r'\s*\([^)]*\)\s*$', '', name)
@@ -804,35 +960,7 @@ class WebsiteService:
     @staticmethod
     def _parse_iso_duration(duration: str) -> str:
         """Parse ISO 8601 duration (PT30M) to human readable (30 min)."""
-        if not duration:
-            return ""
-        
-        # Already human readable
-        if not duration.startswith('P'):
-            return duration
-        
-        try:
-            # Parse ISO 8601 duration
-            pattern = r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?'
-            match = re.match(pattern, duration)
-            if not match:
-                return duration
-            
-            days, hours, minutes, seconds = match.groups()
-            parts = []
-            
-            if days:
-                parts.append(f"{days} day{'s' if int(days) > 1 else ''}")
-            if hours:
-                parts.append(f"{hours} hour{'s' if int(hours) > 1 else ''}")
-            if minutes:
-                parts.append(f"{minutes} min")
-            if seconds and not minutes:  # Only show seconds if no minutes
-                parts.append(f"{seconds} sec")
-            
-            return ' '.join(parts) if parts else duration
-        except:
-            return duration
+        return _parse_iso_duration_cached(duration)
     
     @classmethod
     def _extract_main_content(cls, html: str) -> Optional[str]:
@@ -844,51 +972,81 @@ class WebsiteService:
             for tag in soup.find_all(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe', 'noscript']):
                 tag.decompose()
             
-            # First, try to find recipe-specific content areas
+            # First, try to find recipe-specific content areas. Walk the tree once,
+            # remembering the first match for each section and its fallbacks,
+            # rather than running a separate find() per section.
+            ingredients_list = ingredients_by_class = ingredients_by_id = None
+            steps_list = directions_by_class = directions_by_id = None
+            title = servings = None
+            
+            for node in soup.descendants:
+                if isinstance(node, NavigableString):
+                    if servings is None and _SERVINGS_RE.search(node):
+                        servings = node
+                    continue
+                
+                classes = node.get('class') or ''
+                if isinstance(classes, list):
+                    classes = ' '.join(classes)
+                elem_id = node.get('id') or ''
+                
+                if classes:
+                    if _INGREDIENT_RE.search(classes):
+                        if ingredients_list is None and node.name in ('ul', 'ol'):
+                            ingredients_list = node
+                        if ingredients_by_class is None:
+                            ingredients_by_class = node
+                    if steps_list is None and node.name == 'ol' and _STEPS_CLASS_RE.search(classes):
+                        steps_list = node
+                    if directions_by_class is None and _DIRECTIONS_CLASS_RE.search(classes):
+                        directions_by_class = node
+                if elem_id:
+                    if ingredients_by_id is None and _INGREDIENT_RE.search(elem_id):
+                        ingredients_by_id = node
+                    if directions_by_id is None and _DIRECTIONS_ID_RE.search(elem_id):
+                        directions_by_id = node
+                if title is None and node.name == 'h1':
+                    title = node
+                
+                # Fallbacks only matter when a preferred match is missing
+                if ingredients_list and steps_list and title and servings:
+                    break
+            
             content_parts = []
             
-            # Look for ingredients - prioritize lists with ingredient-related classes
-            ingredients_list = soup.find(['ul', 'ol'], class_=re.compile(r'ingredient', re.I))
-            if ingredients_list:
-                content_parts.append("INGREDIENTS:\n" + ingredients_list.get_text(separator='\n', strip=True))
-            else:
-                # Fallback: find any element with ingredient class
-                ingredients_section = soup.find(class_=re.compile(r'ingredient', re.I)) or \
-                                      soup.find(id=re.compile(r'ingredient', re.I))
-                if ingredients_section:
-                    content_parts.append("INGREDIENTS:\n" + ingredients_section.get_text(separator='\n', strip=True))
+            # Ingredients - prefer lists with ingredient-related classes,
+            # then any element with an ingredient class or id
+            ingredients_section = ingredients_list or ingredients_by_class or ingredients_by_id
+            if ingredients_section:
+                content_parts.append("INGREDIENTS:\n" + ingredients_section.get_text(separator='\n', strip=True))
             
-            # Look for instructions/steps - prioritize ordered lists with step-related classes
-            steps_list = soup.find('ol', class_=re.compile(r'prep|step|instruction|direction|method', re.I))
-            if steps_list:
-                content_parts.append("INSTRUCTIONS:\n" + steps_list.get_text(separator='\n', strip=True))
-            else:
-                # Fallback: find any element with instruction/step class
-                directions_section = soup.find(class_=re.compile(r'direction|instruction|preparation', re.I)) or \
-                                     soup.find(id=re.compile(r'direction|instruction|step', re.I))
-                if directions_section:
-                    content_parts.append("INSTRUCTIONS:\n" + directions_section.get_text(separator='\n', strip=True))
+            # Instructions - prefer ordered lists with step-related classes,
+            # then any element with an instruction/step class or id
+            directions_section = steps_list or directions_by_class or directions_by_id
+            if directions_section:
+                content_parts.append("INSTRUCTIONS:\n" + directions_section.get_text(separator='\n', strip=True))
             
             # Also look for recipe title and description
-            title = soup.find('h1')
             if title:
                 content_parts.insert(0, f"TITLE: {title.get_text(strip=True)}")
             
             # Look for servings/yield
-            servings = soup.find(string=re.compile(r'(serves?|yields?|makes?)\s*:?\s*\d+', re.I))
             if servings:
                 content_parts.append(f"SERVINGS: {servings.strip()}")
             
-            # If we found specific sections, use them
-            if len(content_parts) >= 2:  # At least title + one section
+            # If we found specific sections, use them - targeted sections beat the
+            # generic fallbacks below even when short, as long as they're long
+            # enough for extract() to accept
+            has_section = ingredients_section is not None or directions_section is not None
+            if has_section and len(content_parts) >= 2:  # At least title + one section
                 combined = '\n\n'.join(content_parts)
-                if len(combined) > 300:  # Lower threshold since we're being more targeted
+                if len(combined) >= 100:
                     print(f"📄 Extracted recipe sections: {len(combined)} characters")
                     return combined
             
             # Fallback: Try to find main content area
             main = soup.find('main') or soup.find('article') or \
-                   soup.find(class_=re.compile(r'recipe|content|post', re.I))
+                   soup.find(class_=_MAIN_CONTENT_CLASS_RE)
             if main:
                 text = main.get_text(separator='\n', strip=True)
                 if len(text) > 500:
@@ -899,8 +1057,10 @@ class WebsiteService:
             if trafilatura:
                 traf_content = trafilatura.extract(
                     html,
+                    output_format='txt',
                     include_comments=False,
                     include_tables=True,
+                    deduplicate=True,
                     no_fallback=False,
                 )
                 if traf_content and len(traf_content) > 500:
@@ -925,32 +1085,46 @@ class WebsiteService:
         """Extract thumbnail/image URL from page."""
         # Try JSON-LD first
         if jsonld:
-            image = jsonld.get('image')
-            if image:
-                if isinstance(image, str):
-                    return image
-                elif isinstance(image, list) and image:
-                    first_img = image[0]
-                    if isinstance(first_img, str):
-                        return first_img
-                    elif isinstance(first_img, dict):
-                        return first_img.get('url')
-                elif isinstance(image, dict):
-                    return image.get('url')
+            image_url = cls._image_url_from_jsonld(jsonld.get('image'))
+            if image_url:
+                return image_url
         
-        # Try Open Graph image
-        soup = BeautifulSoup(html, 'lxml')
-        og_image = soup.find('meta', property='og:image')
-        if og_image and og_image.get('content'):
-            return og_image['content']
+        # Cheap scan for the usual <meta property="og:image" content="..."> layout
+        # before paying for a full parse
+        og_match = _OG_IMAGE_RE.search(html)
+        if og_match:
+            return unescape(og_match.group(1))
         
-        # Try Twitter image
-        twitter_image = soup.find('meta', attrs={'name': 'twitter:image'})
-        if twitter_image and twitter_image.get('content'):
-            return twitter_image['content']
+        # Try Open Graph image (any attribute order), then Twitter image.
+        # Two meta lookups don't need a BeautifulSoup tree - plain lxml will do.
+        try:
+            tree = lxml.html.fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration
+            tree = lxml.html.fromstring(html.encode('utf-8'))
+        
+        for xpath in _META_IMAGE_XPATHS:
+            for content in tree.xpath(xpath):
+                if content:
+                    return str(content)
         
         return None
     
+    @classmethod
+    def _image_url_from_jsonld(cls, image: Any) -> Optional[str]:
+        """Resolve a JSON-LD image value (URL, ImageObject, or list of either) to a URL."""
+        image_type = type(image)
+        if image_type is str:
+            return image or None
+        if image_type is dict:
+            return image.get('url') or None
+        if image_type is list:
+            for item in image:
+                url = cls._image_url_from_jsonld(item)
+                if url:
+                    return url
+        return None
+    
     @classmethod
     async def _ai_extract_recipe(
         cls,
@@ -960,65 +1134,25 @@ class WebsiteService:
         notes: str = "",
     ) -> Optional[dict]:
         """Use AI to extract recipe from text content."""
-        from app.services.llm_client import llm_service
-        
-        prompt = f"""Extract the recipe from this webpage content. Return a JSON object with the recipe details.
-
-URL: {url}
-
-WEBPAGE CONTENT:
-{content[:8000]}
-
-Return a JSON object with these fields:
-{{
-  "title": "Recipe title",
-  "description": "Brief description",
-  "servings": number or null,
-  "times": {{
-    "prep": "prep time string",
-    "cook": "cook time string", 
-    "total": "total time string"
-  }},
-  "components": [
-    {{
-      "name": "Component/section name (e.g., 'Chicken Marinade', 'Sauce', 'Main Dish') or empty string if no sections",
-      "ingredients": [
-        {{"name": "ingredient name", "quantity": "amount", "unit": "unit", "notes": "optional notes", "original": "full original text"}}
-      ],
-      "steps": ["step 1 text", "step 2 text"]
-    }}
-  ],
-  "tags": ["tag1", "tag2"],
-  "mealTypes": ["breakfast", "lunch", "dinner", "snack", "dessert"],
-  "nutrition": {{
-    "perServing": {{"calories": number, "protein": number, "carbs": number, "fat": number, "fiber": number, "sugar": number, "sodium": number}}
-  }},
-  "notes": "{notes or 'any recipe notes'}",
-  "location": "{location}"
-}}
-
-IMPORTANT:
-- If the recipe has SECTIONS (like "Chicken Marinade:", "Sauce:", "For the filling:"), create SEPARATE components for each section
-- Each component should have its own name, ingredients, and steps
-- If there are no clear sections, use a single component with an empty name
-- Extract ALL ingredients mentioned, grouped by their section
-- Extract ALL steps in order, grouped by their section
-- Use reasonable estimates for times if not explicitly stated
-- NUTRITION: If the website provides nutrition info, use it. If NOT provided, ESTIMATE the nutrition per serving based on the ingredients and typical values. Always provide nutrition estimates - never leave it empty.
-- Only return valid JSON, no explanation"""
+        prompt = _RECIPE_PROMPT_TEMPLATE.format(
+            url=url,
+            content=_truncate_for_prompt(content),
+            notes=notes or 'any recipe notes',
+            location=location,
+        )
 
         try:
             result = await llm_service.generate_json(prompt)
             if result and isinstance(result, dict) and result.get('title'):
                 # Validate that we have REAL recipe content, not placeholder garbage
                 title = result.get('title', '').lower().strip()
-                placeholder_titles = ['recipe title', 'untitled', 'recipe', 'title', 'no title', 'unknown']
                 
-                if title in placeholder_titles:
+                if title in _PLACEHOLDER_TITLES:
                     print(f"⚠️ AI returned placeholder title: '{result.get('title')}' - rejecting")
                     return None
                 
-                # Check for actual ingredients or steps
+                # Check for actual ingredients or steps (raw counts, before
+                # normalization below drops non-text steps)
                 components = result.get('components', [])
                 flat_ingredients = result.get('ingredients', [])
                 flat_steps = result.get('steps', [])
@@ -1031,34 +1165,24 @@ IMPORTANT:
                     print(f"⚠️ AI returned recipe with no ingredients and no steps - rejecting")
                     return None
                 
+                # Normalize steps within each component (HowToStep dicts -> text)
+                # and collect all ingredients/steps for the legacy flat fields
+                for comp in components:
+                    comp['steps'] = [
+                        step['text'] if isinstance(step, dict) else step
+                        for step in comp.get('steps', [])
+                        if isinstance(step, str) or (isinstance(step, dict) and 'text' in step)
+                    ]
+                    # Ensure component has name (empty string is ok)
+                    comp.setdefault('name', '')
+                
+                all_ingredients = [ing for comp in components for ing in comp.get('ingredients', [])]
+                all_steps = [step for comp in components for step in comp['steps']]
+                
                 # Add required fields to match schema
                 result['sourceUrl'] = url
                 result['media'] = {'sourceUrl': url}
                 
-                # Process components - normalize steps within each component
-                components = result.get('components', [])
-                all_ingredients = []
-                all_steps = []
-                
-                for comp in components:
-                    # Normalize steps within component
-                    comp_steps = comp.get('steps', [])
-                    normalized_steps = []
-                    for step in comp_steps:
-                        if isinstance(step, dict) and 'text' in step:
-                            normalized_steps.append(step['text'])
-                        elif isinstance(step, str):
-                            normalized_steps.append(step)
-                    comp['steps'] = normalized_steps
-                    
-                    # Ensure component has name (empty string is ok)
-                    if 'name' not in comp:
-                        comp['name'] = ''
-                    
-                    # Collect all ingredients/steps for legacy fields
-                    all_ingredients.extend(comp.get('ingredients', []))
-                    all_steps.extend(normalized_steps)
-                
                 # If no components were returned, create one from flat fields
                 if not components:
                     ingredients = result.get('ingredients', [])
@@ -9,12 +9,18 @@ across different short URLs for the same video.
 import asyncio
 import re
 import httpx
-from sqlalchemy import select
+from sqlalchemy import select, update
 from app.db.database import AsyncSessionLocal
 from app.models.recipe import Recipe
 
+# Max short URLs being resolved at once
+CONCURRENCY = 10
 
-async def normalize_tiktok_url(url: str) -> str:
+# Rows fetched per round trip while streaming, and URL fixes per bulk UPDATE
+STREAM_BATCH_SIZE = 500
+
+
+async def normalize_tiktok_url(client: httpx.AsyncClient, url: str) -> str:
     """Resolve a TikTok short URL to its canonical form."""
     if not url or "tiktok.com" not in url.lower():
         return url
@@ -28,18 +34,17 @@ async def normalize_tiktok_url(url: str) -> str:
     # Short URL - need to resolve
     if "/t/" in url or "vm.tiktok.com" in url:
         try:
-            async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-                response = await client.head(url)
-                resolved_url = str(response.url)
-                print(f"  Resolved: {url} -> {resolved_url}")
-                
-                # Extract video ID from resolved URL
-                video_id_match = re.search(r'/video/(\d+)', resolved_url)
-                if video_id_match:
-                    video_id = video_id_match.group(1)
-                    return f"https://www.tiktok.com/video/{video_id}"
-                
-                return resolved_url
+            response = await client.head(url)
+            resolved_url = str(response.url)
+            print(f"  Resolved: {url} -> {resolved_url}")
+            
+            # Extract video ID from resolved URL
+            video_id_match = re.search(r'/video/(\d+)', resolved_url)
+            if video_id_match:
+                video_id = video_id_match.group(1)
+                return f"https://www.tiktok.com/video/{video_id}"
+            
+            return resolved_url
         except Exception as e:
             print(f"  Failed to resolve {url}: {e}")
             return url
@@ -51,47 +56,80 @@ async def upgrade():
     """Normalize all TikTok URLs in the database."""
     print("Starting TikTok URL normalization migration...")
     
-    async with AsyncSessionLocal() as db:
-        # Get all TikTok recipes
-        result = await db.execute(
-            select(Recipe).where(Recipe.source_type == "tiktok")
-        )
-        recipes = result.scalars().all()
+    processed = 0
+    updated = 0
+    skipped = 0
+    failed = 0
+    updates = []
+    queue = asyncio.Queue(maxsize=CONCURRENCY * 2)
+    
+    # Rows are streamed on one session while fixes are written through another,
+    # so the open cursor is never shared with the UPDATEs
+    async with AsyncSessionLocal() as db, AsyncSessionLocal() as write_db, \
+            httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
         
-        print(f"Found {len(recipes)} TikTok recipes to process")
+        async def flush_updates():
+            """Write pending URL changes in one bulk UPDATE (by primary key)."""
+            nonlocal updated
+            if not updates:
+                return
+            batch = updates.copy()
+            updates.clear()
+            await write_db.execute(update(Recipe), batch)
+            await write_db.commit()
+            updated += len(batch)
         
-        updated = 0
-        skipped = 0
-        failed = 0
+        async def worker():
+            nonlocal skipped, failed
+            while True:
+                recipe_id, old_url = await queue.get()
+                try:
+                    new_url = await normalize_tiktok_url(client, old_url)
+                    if new_url != old_url:
+                        updates.append({"id": recipe_id, "source_url": new_url})
+                        print(f"  Updated recipe {recipe_id}")
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    print(f"  Failed to process recipe {recipe_id}: {e}")
+                    failed += 1
+                finally:
+                    queue.task_done()
         
-        for recipe in recipes:
-            old_url = recipe.source_url
-            
-            # Skip if already normalized
-            if old_url and "/video/" in old_url and "/t/" not in old_url:
-                print(f"  Already normalized: {old_url}")
-                skipped += 1
-                continue
-            
-            try:
-                new_url = await normalize_tiktok_url(old_url)
+        workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
+        
+        try:
+            # Stream TikTok recipes instead of loading them all up front
+            result = await db.stream_scalars(
+                select(Recipe)
+                .where(Recipe.source_type == "tiktok")
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            async for recipe in result:
+                processed += 1
+                old_url = recipe.source_url
                 
-                if new_url != old_url:
-                    recipe.source_url = new_url
-                    updated += 1
-                    print(f"  Updated recipe {recipe.id}")
-                else:
+                # Skip if already normalized
+                if old_url and "/video/" in old_url and "/t/" not in old_url:
+                    print(f"  Already normalized: {old_url}")
                     skipped += 1
-            except Exception as e:
-                print(f"  Failed to process recipe {recipe.id}: {e}")
-                failed += 1
-        
-        await db.commit()
-        
-        print(f"\nMigration complete:")
-        print(f"   - Updated: {updated}")
-        print(f"   - Skipped: {skipped}")
-        print(f"   - Failed: {failed}")
+                    continue
+                
+                await queue.put((recipe.id, old_url))
+                
+                if len(updates) >= STREAM_BATCH_SIZE:
+                    await flush_updates()
+            
+            await queue.join()
+            await flush_updates()
+        finally:
+            for task in workers:
+                task.cancel()
+    
+    print(f"\nMigration complete ({processed} TikTok recipes processed):")
+    print(f"   - Updated: {updated}")
+    print(f"   - Skipped: {skipped}")
+    print(f"   - Failed: {failed}")
 
 
 if __name__ == "__main__":
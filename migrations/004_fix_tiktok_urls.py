@@ -9,10 +9,34 @@ recover the full URLs with usernames.
 import asyncio
 import re
 import httpx
-from sqlalchemy import select
-from app.db.database import AsyncSessionLocal
+from sqlalchemy import select, text
+from app.db.database import AsyncSessionLocal, engine
 from app.models.recipe import Recipe
 
+# Concurrent oEmbed lookups (all sharing the pacer below)
+CONCURRENCY = 4
+
+# oEmbed requests started per second across all workers (the sequential
+# version's 0.5s pause per lookup was ~2/s)
+REQUESTS_PER_SECOND = 2
+
+# Rows fetched per round trip while streaming, and URL fixes per bulk UPDATE
+STREAM_BATCH_SIZE = 500
+
+# Pacer state: every lookup reserves the next start slot under the lock
+_pace_lock = asyncio.Lock()
+_next_request_at = 0.0
+
+
+async def _pace():
+    """Wait for this lookup's slot, keeping all workers to REQUESTS_PER_SECOND."""
+    global _next_request_at
+    async with _pace_lock:
+        now = asyncio.get_running_loop().time()
+        start_at = max(now, _next_request_at)
+        _next_request_at = start_at + 1 / REQUESTS_PER_SECOND
+    await asyncio.sleep(start_at - now)
+
 
 async def get_full_tiktok_url(video_id: str) -> str | None:
     """Use TikTok's oEmbed API to get the full URL for a video ID."""
@@ -41,56 +65,119 @@ async def get_full_tiktok_url(video_id: str) -> str | None:
     return None
 
 
+async def create_broken_url_index():
+    """Index the broken TikTok URLs so the scan below doesn't read the whole table."""
+    # CREATE INDEX CONCURRENTLY doesn't block writers, but can't run in a transaction
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_tiktok_broken
+            ON recipes (source_url)
+            WHERE source_type = 'tiktok' AND source_url LIKE 'https://www.tiktok.com/video/%'
+        """))
+
+
+async def drop_broken_url_index():
+    """Drop the temporary broken-URL index once the migration is done with it."""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_recipes_tiktok_broken"))
+
+
 async def upgrade():
     """Fix TikTok URLs that were incorrectly normalized."""
     print("Starting TikTok URL fix migration...")
     
-    async with AsyncSessionLocal() as db:
-        # Find recipes with broken TikTok URLs (no @ in the URL)
-        result = await db.execute(
-            select(Recipe).where(
-                Recipe.source_type == "tiktok",
-                Recipe.source_url.like("https://www.tiktok.com/video/%")
-            )
-        )
-        recipes = result.scalars().all()
-        
-        print(f"Found {len(recipes)} TikTok recipes with broken URLs to fix")
-        
-        fixed = 0
-        failed = 0
-        
-        for recipe in recipes:
-            old_url = recipe.source_url
-            
-            # Extract video ID
-            video_id_match = re.search(r'/video/(\d+)', old_url)
-            if not video_id_match:
-                print(f"  Could not extract video ID from: {old_url}")
-                failed += 1
-                continue
+    await create_broken_url_index()
+    
+    found = 0
+    fixed = 0
+    failed = 0
+    updates = []
+    queue = asyncio.Queue(maxsize=CONCURRENCY * 2)
+    
+    # The index is only for this run; drop it even if the run fails part way
+    try:
+        # Rows are streamed on one session while fixes are written through another,
+        # so the open cursor is never shared with the UPDATEs
+        async with AsyncSessionLocal() as db, AsyncSessionLocal() as write_db:
             
-            video_id = video_id_match.group(1)
+            async def flush_updates():
+                """Write pending (recipe_id, new_url) fixes with one executemany."""
+                nonlocal fixed
+                if not updates:
+                    return
+                batch = updates.copy()
+                updates.clear()
+                # Straight to asyncpg: the UPDATE is prepared once and every row is
+                # bound against it (atomically), skipping ORM bulk-update overhead
+                conn = await write_db.connection()
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.executemany(
+                    "UPDATE recipes SET source_url = $2 WHERE id = $1", batch
+                )
+                await write_db.commit()
+                fixed += len(batch)
             
-            # Try to get the full URL
-            new_url = await get_full_tiktok_url(video_id)
+            async def worker():
+                nonlocal failed
+                while True:
+                    recipe_id, old_url = await queue.get()
+                    try:
+                        # Extract video ID
+                        video_id_match = re.search(r'/video/(\d+)', old_url)
+                        if not video_id_match:
+                            print(f"  Could not extract video ID from: {old_url}")
+                            failed += 1
+                            continue
+                        
+                        # Try to get the full URL, rate limited across workers so
+                        # TikTok isn't hit too hard
+                        await _pace()
+                        new_url = await get_full_tiktok_url(video_id_match.group(1))
+                        
+                        if new_url and new_url != old_url:
+                            updates.append((recipe_id, new_url))
+                            print(f"  Fixed: {old_url} -> {new_url}")
+                        else:
+                            print(f"  Could not fix: {old_url}")
+                            failed += 1
+                    except Exception as e:
+                        print(f"  Failed to process recipe {recipe_id}: {e}")
+                        failed += 1
+                    finally:
+                        queue.task_done()
             
-            if new_url and new_url != old_url:
-                recipe.source_url = new_url
-                fixed += 1
-                print(f"  Fixed: {old_url} -> {new_url}")
-            else:
-                print(f"  Could not fix: {old_url}")
-                failed += 1
+            workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
             
-            # Rate limit to avoid hitting TikTok too hard
-            await asyncio.sleep(0.5)
-        
-        await db.commit()
-        
-        print(f"\nMigration complete:")
-        print(f"   - Fixed: {fixed}")
-        print(f"   - Failed: {failed}")
+            try:
+                # Stream recipes with broken TikTok URLs (no @ in the URL)
+                result = await db.stream_scalars(
+                    select(Recipe)
+                    .where(
+                        Recipe.source_type == "tiktok",
+                        Recipe.source_url.like("https://www.tiktok.com/video/%")
+                    )
+                    .execution_options(yield_per=STREAM_BATCH_SIZE)
+                )
+                async for recipe in result:
+                    found += 1
+                    await queue.put((recipe.id, recipe.source_url))
+                    
+                    if len(updates) >= STREAM_BATCH_SIZE:
+                        await flush_updates()
+                
+                await queue.join()
+                await flush_updates()
+            finally:
+                for task in workers:
+                    task.cancel()
+    finally:
+        await drop_broken_url_index()
+    
+    print(f"\nMigration complete ({found} TikTok recipes with broken URLs):")
+    print(f"   - Fixed: {fixed}")
+    print(f"   - Failed: {failed}")
 
 
 if __name__ == "__main__":
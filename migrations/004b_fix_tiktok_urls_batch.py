@@ -5,22 +5,99 @@ Processes in batches and commits incrementally to avoid timeouts.
 """
 
 import asyncio
+import random
 import re
 import httpx
-from sqlalchemy import select, update
-from app.db.database import AsyncSessionLocal
+from sqlalchemy import func, select, text
+from app.db.database import engine, migration_engine
 from app.models.recipe import Recipe
 
+# Rows fetched per round trip from the streaming cursor
 BATCH_SIZE = 20
 
+# URL fixes per staged UPDATE + commit
+COMMIT_BATCH_SIZE = 50
+
+# Bound on items waiting between pipeline stages
+QUEUE_SIZE = 200
+
+# Regex (Postgres flavour) capturing the numeric video ID from a TikTok URL
+VIDEO_ID_PATTERN = r'/video/(\d+)'
+
+# Rows still carrying a broken URL. Kept as literal SQL (not bound parameters)
+# so the planner can match the row query against the partial index below.
+BROKEN_URL_FILTER = "source_type = 'tiktok' AND source_url LIKE 'https://www.tiktok.com/video/%'"
+
+# (recipe_id, video_id) for every broken row - only the columns we need, not
+# full Recipe objects with their JSONB payloads. Postgres pulls the video ID
+# out of the URL for us. Built once at import so it's compiled once.
+BROKEN_ROWS_QUERY = select(
+    Recipe.id,
+    func.substring(Recipe.source_url, VIDEO_ID_PATTERN).label("video_id"),
+).where(
+    text(BROKEN_URL_FILTER),
+    Recipe.source_url.regexp_match(r'/video/\d+'),
+).order_by(Recipe.id)
+
+# Lookup workers, i.e. max oEmbed requests in flight at once
+CONCURRENCY = 5
+
+# Tries per video before giving up on a rate-limited or flaky lookup
+MAX_ATTEMPTS = 4
+
+# oEmbed requests started per second across all workers (the old 0.3s sleep
+# between lookups was ~3/s)
+REQUESTS_PER_SECOND = 3
+
+# Shared across the whole migration so lookups ride warm (HTTP/2) connections
+# to tiktok.com instead of paying DNS + TLS setup per video
+_client = httpx.AsyncClient(
+    http2=True,
+    timeout=15.0,
+    limits=httpx.Limits(max_keepalive_connections=10, max_connections=10),
+)
+
+# Pacer state: every request reserves the next start slot under the lock
+_pace_lock = asyncio.Lock()
+_next_request_at = 0.0
+
+# One lookup per video ID for the whole run (result None = lookup failed);
+# recipes sharing a video await the same task instead of refetching it
+_lookups: dict[str, asyncio.Task] = {}
+
+
+def _retry_delay(response: httpx.Response | None, attempt: int) -> float:
+    """Seconds to wait before the next oEmbed attempt: Retry-After on 429s, else exponential backoff."""
+    if response is not None and response.status_code == 429:
+        try:
+            retry_after = float(response.headers.get("Retry-After", "2"))
+        except ValueError:
+            # HTTP-date form - not worth parsing for a one-off migration
+            retry_after = 2.0
+        # Capped like the backoff below, so one huge value can't stall the run
+        return min(60, retry_after) + random.uniform(0, 0.5)
+    return min(30, 2 ** attempt) + random.uniform(0, 1)
+
+
+async def _pace():
+    """Wait for this request's slot, keeping all workers to REQUESTS_PER_SECOND."""
+    global _next_request_at
+    async with _pace_lock:
+        now = asyncio.get_running_loop().time()
+        start_at = max(now, _next_request_at)
+        _next_request_at = start_at + 1 / REQUESTS_PER_SECOND
+    await asyncio.sleep(start_at - now)
+
 
 async def get_full_tiktok_url(video_id: str) -> str | None:
     """Use TikTok's oEmbed API to get the full URL for a video ID."""
     test_url = f"https://www.tiktok.com/@tiktok/video/{video_id}"
     
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(
+    for attempt in range(MAX_ATTEMPTS):
+        response = None
+        try:
+            await _pace()
+            response = await _client.get(
                 f"https://www.tiktok.com/oembed?url={test_url}"
             )
             if response.status_code == 200:
@@ -31,67 +108,162 @@ async def get_full_tiktok_url(video_id: str) -> str | None:
                     if username_match:
                         username = username_match.group(1)
                         return f"https://www.tiktok.com/@{username}/video/{video_id}"
-    except Exception as e:
-        pass
+                return None
+            if response.status_code != 429 and response.status_code < 500:
+                # Deleted/private video - retrying won't change the answer
+                return None
+        except Exception as e:
+            pass
+        
+        # Transient failure (rate limit, 5xx, network) - back off and retry
+        if attempt < MAX_ATTEMPTS - 1:
+            await asyncio.sleep(_retry_delay(response, attempt))
     
     return None
 
 
-async def process_batch(recipes):
-    """Process a batch of recipes and return updates."""
-    updates = []
-    for recipe in recipes:
-        video_id_match = re.search(r'/video/(\d+)', recipe.source_url)
-        if video_id_match:
-            video_id = video_id_match.group(1)
-            new_url = await get_full_tiktok_url(video_id)
-            if new_url:
-                updates.append((recipe.id, new_url))
-                print(f"  ✓ {video_id}")
-            else:
-                print(f"  ✗ {video_id} (API failed)")
-            await asyncio.sleep(0.3)  # Rate limit
-    return updates
+async def create_staging_table(conn):
+    """Create the connection-local table each chunk of fixes is COPYed into."""
+    # Emptied by every commit, so each chunk starts from a clean table
+    await conn.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS _tiktok_fix (
+            id UUID PRIMARY KEY,
+            new_url TEXT NOT NULL
+        ) ON COMMIT DELETE ROWS
+    """))
+    await conn.commit()
+
+
+async def apply_updates(conn, updates):
+    """COPY a chunk of (recipe_id, new_url) fixes into staging and apply them with one UPDATE."""
+    if not updates:
+        return
+    
+    # Opens the chunk's transaction on conn. asyncpg's COPY alone would run in
+    # its own autocommit transaction, and ON COMMIT DELETE ROWS would empty
+    # the staging table again before the UPDATE below could read it.
+    await conn.execute(text("TRUNCATE _tiktok_fix"))
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "_tiktok_fix", records=updates, columns=["id", "new_url"]
+    )
+    await conn.execute(text("""
+        UPDATE recipes SET source_url = t.new_url
+        FROM _tiktok_fix t
+        WHERE recipes.id = t.id
+    """))
+
+
+async def create_batch_index():
+    """
+    Index the ids of rows with broken URLs, so the id-ordered stream of them
+    is a scan of a small partial index instead of a pass over the whole table.
+    """
+    # CONCURRENTLY doesn't block writers, but can't run inside a transaction
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_tiktok_broken_id
+            ON recipes (id)
+            WHERE {BROKEN_URL_FILTER}
+        """))
+
+
+async def drop_batch_index():
+    """Drop the temporary batch index once the migration is done with it."""
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_recipes_tiktok_broken_id"))
 
 
 async def upgrade():
     """Fix TikTok URLs in batches."""
     print("Starting TikTok URL fix (batch mode)...")
     
+    await create_batch_index()
+    
     total_fixed = 0
     total_failed = 0
     
-    while True:
-        async with AsyncSessionLocal() as db:
-            # Get next batch of broken URLs
-            result = await db.execute(
-                select(Recipe).where(
-                    Recipe.source_type == "tiktok",
-                    Recipe.source_url.like("https://www.tiktok.com/video/%")
-                ).limit(BATCH_SIZE)
-            )
-            recipes = result.scalars().all()
+    # Pipeline: a producer streams broken rows, CONCURRENCY workers look up
+    # URLs, and a committer writes fixes - so DB reads, HTTP and DB writes
+    # overlap instead of taking turns
+    rows_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    results_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    
+    # Unlike the DDL-only migrations this runs on the main engine: its asyncpg
+    # statement cache lets every chunk reuse the prepared staging UPDATE
+    try:
+        # One server-side cursor over every broken row, planned once. It reads
+        # from its own connection because committing a chunk would close it;
+        # the writer connection also keeps the TEMP staging table alive.
+        async with engine.connect() as read_conn, engine.connect() as conn:
+            await create_staging_table(conn)
             
-            if not recipes:
-                break
+            async def produce():
+                result = await read_conn.stream(
+                    BROKEN_ROWS_QUERY.execution_options(yield_per=BATCH_SIZE)
+                )
+                async for recipe_id, video_id in result:
+                    await rows_queue.put((recipe_id, video_id))
+                for _ in range(CONCURRENCY):
+                    await rows_queue.put(None)
             
-            print(f"\nProcessing batch of {len(recipes)} recipes...")
+            async def look_up():
+                while (row := await rows_queue.get()) is not None:
+                    recipe_id, video_id = row
+                    if video_id not in _lookups:
+                        _lookups[video_id] = asyncio.create_task(get_full_tiktok_url(video_id))
+                    await results_queue.put((recipe_id, video_id, await _lookups[video_id]))
             
-            # Process batch
-            updates = await process_batch(recipes)
+            async def look_up_all():
+                async with asyncio.TaskGroup() as workers:
+                    for _ in range(CONCURRENCY):
+                        workers.create_task(look_up())
+                await results_queue.put(None)
             
-            # Apply updates
-            for recipe_id, new_url in updates:
-                await db.execute(
-                    update(Recipe).where(Recipe.id == recipe_id).values(source_url=new_url)
-                )
+            async def commit_fixes():
+                nonlocal total_fixed, total_failed
+                done = False
+                while not done:
+                    updates = []
+                    failed = []
+                    while len(updates) + len(failed) < COMMIT_BATCH_SIZE:
+                        item = await results_queue.get()
+                        if item is None:
+                            done = True
+                            break
+                        recipe_id, video_id, new_url = item
+                        if new_url:
+                            updates.append((recipe_id, new_url))
+                        else:
+                            failed.append(video_id)
+                    
+                    if not updates and not failed:
+                        break
+                    
+                    await apply_updates(conn, updates)
+                    await conn.commit()
+                    total_fixed += len(updates)
+                    total_failed += len(failed)
+                    # One line per chunk rather than one write per video
+                    line = f"Committed {len(updates)} fixes, {len(failed)} failed"
+                    if failed:
+                        line += f" (API failed: {', '.join(failed[:5])}{', ...' if len(failed) > 5 else ''})"
+                    print(line)
             
-            await db.commit()
-            total_fixed += len(updates)
-            total_failed += len(recipes) - len(updates)
-            print(f"  Committed {len(updates)} fixes")
+            # A failure in any stage cancels the others rather than leaving
+            # them blocked on a full queue
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(produce())
+                stages.create_task(look_up_all())
+                stages.create_task(commit_fixes())
+    finally:
+        await _client.aclose()
+        # Drop the run-only index even if a pipeline stage failed
+        await drop_batch_index()
     
-    print(f"\n✓ Migration complete: {total_fixed} fixed, {total_failed} failed")
+    print(f"✓ Migration complete: {total_fixed} fixed, {total_failed} failed")
 
 
 if __name__ == "__main__":
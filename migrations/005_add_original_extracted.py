@@ -10,37 +10,24 @@ Run with: python -m migrations.005_add_original_extracted
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Add original_extracted column to recipes table."""
-    async with engine.begin() as conn:
-        # Check if column already exists
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'recipes' AND column_name = 'original_extracted'
-        """))
-        exists = result.fetchone()
-        
-        if exists:
-            print("Column 'original_extracted' already exists, skipping...")
-            return
-        
-        # Add the column
-        print("Adding 'original_extracted' column to recipes table...")
+    async with migration_engine.begin() as conn:
+        # IF NOT EXISTS makes re-runs a no-op without a separate probe
         await conn.execute(text("""
             ALTER TABLE recipes 
-            ADD COLUMN original_extracted JSONB DEFAULT NULL
+            ADD COLUMN IF NOT EXISTS original_extracted JSONB DEFAULT NULL
         """))
         
-        print("✅ Migration complete: added original_extracted column")
+        print("✅ Migration complete: original_extracted column is in place")
 
 
 async def downgrade():
     """Remove original_extracted column."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("""
             ALTER TABLE recipes DROP COLUMN IF EXISTS original_extracted
         """))
@@ -6,51 +6,42 @@ Run with: python -m migrations.006_add_saved_recipes
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Add saved_recipes table."""
-    async with engine.begin() as conn:
-        # Check if table already exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'saved_recipes'
-        """))
-        exists = result.fetchone()
+    async with migration_engine.connect() as conn:
+        # CONCURRENTLY index builds don't block writes to a populated table,
+        # but can't run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         
-        if exists:
-            print("Table 'saved_recipes' already exists, skipping...")
-            return
-        
-        # Create saved_recipes table
-        print("Creating 'saved_recipes' table...")
-        await conn.execute(text("""
-            CREATE TABLE saved_recipes (
+        # Tables in one round trip via asyncpg's simple query protocol;
+        # IF NOT EXISTS makes every statement safe to re-run
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.execute("""
+            CREATE TABLE IF NOT EXISTS saved_recipes (
                 id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                 user_id VARCHAR(64) NOT NULL,
                 recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
                 UNIQUE(user_id, recipe_id)
             );
-        """))
-        
-        # Create indexes for fast lookups
-        await conn.execute(text("""
-            CREATE INDEX idx_saved_recipes_user_id ON saved_recipes(user_id);
-        """))
+        """)
         
-        await conn.execute(text("""
-            CREATE INDEX idx_saved_recipes_recipe_id ON saved_recipes(recipe_id);
-        """))
+        # Each concurrent build has to be its own statement
+        for index in (
+            "idx_saved_recipes_user_id ON saved_recipes(user_id)",
+            "idx_saved_recipes_recipe_id ON saved_recipes(recipe_id)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
         
-        print("✅ Created saved_recipes table with indexes")
+        print("✅ saved_recipes table and indexes are in place")
 
 
 async def downgrade():
     """Remove saved_recipes table."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("DROP TABLE IF EXISTS saved_recipes;"))
         print("✅ Dropped saved_recipes table")
 
@@ -8,75 +8,51 @@ Creates:
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Create collections and collection_recipes tables."""
-    async with engine.begin() as conn:
-        # Check if collections table exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'collections'
-        """))
+    async with migration_engine.connect() as conn:
+        # CONCURRENTLY index builds don't block writes to a populated table,
+        # but can't run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         
-        if result.scalar_one_or_none() is None:
-            # Create collections table
-            await conn.execute(text("""
-                CREATE TABLE collections (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    user_id VARCHAR(64) NOT NULL,
-                    name VARCHAR(100) NOT NULL,
-                    emoji VARCHAR(10),
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-                );
-            """))
+        # Tables in one round trip via asyncpg's simple query protocol;
+        # IF NOT EXISTS makes every statement safe to re-run
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.execute("""
+            CREATE TABLE IF NOT EXISTS collections (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id VARCHAR(64) NOT NULL,
+                name VARCHAR(100) NOT NULL,
+                emoji VARCHAR(10),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
             
-            # Create index on user_id for fast lookups
-            await conn.execute(text("""
-                CREATE INDEX idx_collections_user_id ON collections(user_id);
-            """))
-            
-            print("✅ Created collections table with indexes")
-        else:
-            print("ℹ️ Table 'collections' already exists. Skipping.")
+            CREATE TABLE IF NOT EXISTS collection_recipes (
+                collection_id UUID NOT NULL REFERENCES collections(id) ON DELETE CASCADE,
+                recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                added_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                PRIMARY KEY (collection_id, recipe_id)
+            );
+        """)
         
-        # Check if collection_recipes table exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'collection_recipes'
-        """))
+        # Each concurrent build has to be its own statement
+        for index in (
+            "idx_collections_user_id ON collections(user_id)",
+            "idx_collection_recipes_collection_id ON collection_recipes(collection_id)",
+            "idx_collection_recipes_recipe_id ON collection_recipes(recipe_id)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
         
-        if result.scalar_one_or_none() is None:
-            # Create collection_recipes junction table
-            await conn.execute(text("""
-                CREATE TABLE collection_recipes (
-                    collection_id UUID NOT NULL REFERENCES collections(id) ON DELETE CASCADE,
-                    recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
-                    added_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    PRIMARY KEY (collection_id, recipe_id)
-                );
-            """))
-            
-            # Create indexes for fast lookups both ways
-            await conn.execute(text("""
-                CREATE INDEX idx_collection_recipes_collection_id ON collection_recipes(collection_id);
-            """))
-            await conn.execute(text("""
-                CREATE INDEX idx_collection_recipes_recipe_id ON collection_recipes(recipe_id);
-            """))
-            
-            print("✅ Created collection_recipes table with indexes")
-        else:
-            print("ℹ️ Table 'collection_recipes' already exists. Skipping.")
+        print("✅ collections and collection_recipes tables and indexes are in place")
 
 
 async def downgrade():
     """Remove collections tables."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("DROP TABLE IF EXISTS collection_recipes;"))
         await conn.execute(text("DROP TABLE IF EXISTS collections;"))
         print("✅ Downgrade complete: removed collections tables")
@@ -7,49 +7,44 @@ Creates:
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Create recipe_notes table."""
-    async with engine.begin() as conn:
-        # Check if recipe_notes table exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'recipe_notes'
-        """))
+    async with migration_engine.connect() as conn:
+        # CONCURRENTLY index builds don't block writes to a populated table,
+        # but can't run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         
-        if result.scalar_one_or_none() is None:
-            # Create recipe_notes table
-            await conn.execute(text("""
-                CREATE TABLE recipe_notes (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    user_id VARCHAR(64) NOT NULL,
-                    recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
-                    note_text TEXT NOT NULL DEFAULT '',
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    UNIQUE(user_id, recipe_id)
-                );
-            """))
-            
-            # Create indexes for fast lookups
-            await conn.execute(text("""
-                CREATE INDEX idx_recipe_notes_user_id ON recipe_notes(user_id);
-            """))
-            await conn.execute(text("""
-                CREATE INDEX idx_recipe_notes_recipe_id ON recipe_notes(recipe_id);
-            """))
-            
-            print("✅ Created recipe_notes table with indexes")
-        else:
-            print("ℹ️ Table 'recipe_notes' already exists. Skipping.")
+        # Tables in one round trip via asyncpg's simple query protocol;
+        # IF NOT EXISTS makes every statement safe to re-run
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.execute("""
+            CREATE TABLE IF NOT EXISTS recipe_notes (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id VARCHAR(64) NOT NULL,
+                recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                note_text TEXT NOT NULL DEFAULT '',
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                UNIQUE(user_id, recipe_id)
+            );
+        """)
+        
+        # Each concurrent build has to be its own statement
+        for index in (
+            "idx_recipe_notes_user_id ON recipe_notes(user_id)",
+            "idx_recipe_notes_recipe_id ON recipe_notes(recipe_id)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
+        
+        print("✅ recipe_notes table and indexes are in place")
 
 
 async def downgrade():
     """Remove recipe_notes table."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("DROP TABLE IF EXISTS recipe_notes;"))
         print("✅ Downgrade complete: removed recipe_notes table")
 
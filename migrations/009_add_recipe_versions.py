@@ -7,52 +7,47 @@ Creates:
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Create recipe_versions table."""
-    async with engine.begin() as conn:
-        # Check if recipe_versions table exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'recipe_versions'
-        """))
+    async with migration_engine.connect() as conn:
+        # CONCURRENTLY index builds don't block writes to a populated table,
+        # but can't run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         
-        if result.scalar_one_or_none() is None:
-            # Create recipe_versions table
-            await conn.execute(text("""
-                CREATE TABLE recipe_versions (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
-                    version_number INTEGER NOT NULL,
-                    extracted JSONB NOT NULL,
-                    thumbnail_url TEXT,
-                    change_type VARCHAR(32) NOT NULL DEFAULT 'edit',
-                    change_summary TEXT,
-                    created_by VARCHAR(64),
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    UNIQUE(recipe_id, version_number)
-                );
-            """))
-            
-            # Create indexes for fast lookups
-            await conn.execute(text("""
-                CREATE INDEX idx_recipe_versions_recipe_id ON recipe_versions(recipe_id);
-            """))
-            await conn.execute(text("""
-                CREATE INDEX idx_recipe_versions_created_at ON recipe_versions(created_at);
-            """))
-            
-            print("✅ Created recipe_versions table with indexes")
-        else:
-            print("ℹ️ Table 'recipe_versions' already exists. Skipping.")
+        # Tables in one round trip via asyncpg's simple query protocol;
+        # IF NOT EXISTS makes every statement safe to re-run
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.execute("""
+            CREATE TABLE IF NOT EXISTS recipe_versions (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                version_number INTEGER NOT NULL,
+                extracted JSONB NOT NULL,
+                thumbnail_url TEXT,
+                change_type VARCHAR(32) NOT NULL DEFAULT 'edit',
+                change_summary TEXT,
+                created_by VARCHAR(64),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                UNIQUE(recipe_id, version_number)
+            );
+        """)
+        
+        # Each concurrent build has to be its own statement
+        for index in (
+            "idx_recipe_versions_recipe_id ON recipe_versions(recipe_id)",
+            "idx_recipe_versions_created_at ON recipe_versions(created_at)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
+        
+        print("✅ recipe_versions table and indexes are in place")
 
 
 async def downgrade():
     """Remove recipe_versions table."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("DROP TABLE IF EXISTS recipe_versions;"))
         print("✅ Downgrade complete: removed recipe_versions table")
 
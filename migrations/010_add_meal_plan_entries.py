@@ -7,56 +7,50 @@ Creates:
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Create meal_plan_entries table."""
-    async with engine.begin() as conn:
-        # Check if meal_plan_entries table exists
-        result = await conn.execute(text("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_name = 'meal_plan_entries'
-        """))
+    async with migration_engine.connect() as conn:
+        # CONCURRENTLY index builds don't block writes to a populated table,
+        # but can't run inside a transaction
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
         
-        if result.scalar_one_or_none() is None:
-            # Create meal_plan_entries table
-            await conn.execute(text("""
-                CREATE TABLE meal_plan_entries (
-                    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                    user_id VARCHAR(64) NOT NULL,
-                    date DATE NOT NULL,
-                    meal_type VARCHAR(20) NOT NULL,
-                    recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
-                    recipe_title VARCHAR(255) NOT NULL,
-                    recipe_thumbnail VARCHAR(500),
-                    notes VARCHAR(500),
-                    servings VARCHAR(20),
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-                );
-            """))
-            
-            # Create indexes for fast lookups
-            await conn.execute(text("""
-                CREATE INDEX idx_meal_plan_entries_user_id ON meal_plan_entries(user_id);
-            """))
-            await conn.execute(text("""
-                CREATE INDEX idx_meal_plan_entries_date ON meal_plan_entries(date);
-            """))
-            await conn.execute(text("""
-                CREATE INDEX idx_meal_plan_entries_user_date ON meal_plan_entries(user_id, date);
-            """))
-            
-            print("✅ Created meal_plan_entries table with indexes")
-        else:
-            print("ℹ️ Table 'meal_plan_entries' already exists. Skipping.")
+        # Tables in one round trip via asyncpg's simple query protocol;
+        # IF NOT EXISTS makes every statement safe to re-run
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.execute("""
+            CREATE TABLE IF NOT EXISTS meal_plan_entries (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id VARCHAR(64) NOT NULL,
+                date DATE NOT NULL,
+                meal_type VARCHAR(20) NOT NULL,
+                recipe_id UUID NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                recipe_title VARCHAR(255) NOT NULL,
+                recipe_thumbnail VARCHAR(500),
+                notes VARCHAR(500),
+                servings VARCHAR(20),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        
+        # Each concurrent build has to be its own statement
+        for index in (
+            "idx_meal_plan_entries_user_id ON meal_plan_entries(user_id)",
+            "idx_meal_plan_entries_date ON meal_plan_entries(date)",
+            "idx_meal_plan_entries_user_date ON meal_plan_entries(user_id, date)",
+            "idx_meal_plan_entries_recipe_id ON meal_plan_entries(recipe_id)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
+        
+        print("✅ meal_plan_entries table and indexes are in place")
 
 
 async def downgrade():
     """Remove meal_plan_entries table."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("DROP TABLE IF EXISTS meal_plan_entries;"))
         print("✅ Downgrade complete: removed meal_plan_entries table")
 
@@ -13,33 +13,23 @@ Display name is computed at extraction time from:
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Add extractor_display_name column to recipes table."""
-    async with engine.begin() as conn:
-        # Check if column already exists
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'recipes' AND column_name = 'extractor_display_name'
+    async with migration_engine.begin() as conn:
+        # IF NOT EXISTS makes re-runs a no-op without a separate probe
+        await conn.execute(text("""
+            ALTER TABLE recipes 
+            ADD COLUMN IF NOT EXISTS extractor_display_name VARCHAR(100)
         """))
-        
-        if result.scalar_one_or_none() is None:
-            # Add the column
-            await conn.execute(text("""
-                ALTER TABLE recipes 
-                ADD COLUMN extractor_display_name VARCHAR(100)
-            """))
-            print("✅ Added extractor_display_name column to recipes table")
-        else:
-            print("⏭️ extractor_display_name column already exists")
+        print("✅ extractor_display_name column is in place on recipes table")
 
 
 async def downgrade():
     """Remove extractor_display_name column."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         await conn.execute(text("""
             ALTER TABLE recipes DROP COLUMN IF EXISTS extractor_display_name
         """))
@@ -0,0 +1,42 @@
+"""
+Migration 011b: Index meal_plan_entries.recipe_id
+
+Postgres doesn't index the referencing side of a foreign key, so every recipe
+delete had to scan all of meal_plan_entries to apply ON DELETE CASCADE.
+Databases created before 010 gained this index need it added here.
+
+The other recipe_id foreign keys (saved_recipes, collection_recipes,
+recipe_notes, recipe_versions) are already indexed by 006-009.
+"""
+
+import asyncio
+from sqlalchemy import text
+from app.db.database import migration_engine
+
+
+async def upgrade():
+    """Add the recipe_id index to meal_plan_entries."""
+    # CONCURRENTLY doesn't block writers, but can't run inside a transaction
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_meal_plan_entries_recipe_id
+            ON meal_plan_entries(recipe_id)
+        """))
+        print("✅ idx_meal_plan_entries_recipe_id is in place")
+
+
+async def downgrade():
+    """Remove the recipe_id index from meal_plan_entries."""
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_meal_plan_entries_recipe_id"))
+        print("✅ Removed idx_meal_plan_entries_recipe_id")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "down":
+        asyncio.run(downgrade())
+    else:
+        asyncio.run(upgrade())
@@ -0,0 +1,49 @@
+"""
+Migration 011c: Index meal_plan_entries on (user_id, date, meal_type)
+
+The meal planner lists a user's meals in a date range ordered by date and
+meal slot. A (user_id, date, meal_type) index matches that filter and the
+ORDER BY, so the plan needs no sort. Its user_id prefix also serves user-only
+lookups, which makes 010's (user_id) and (user_id, date) indexes redundant;
+dropping them leaves fewer indexes to maintain on every insert.
+"""
+
+import asyncio
+from sqlalchemy import text
+from app.db.database import migration_engine
+
+
+async def upgrade():
+    """Replace the user_id indexes on meal_plan_entries with the composite."""
+    # CONCURRENTLY doesn't block writers, but can't run inside a transaction
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Build the replacement before dropping what it replaces
+        await conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_meal_plan_entries_user_date_meal
+            ON meal_plan_entries(user_id, date, meal_type)
+        """))
+        for index in ("idx_meal_plan_entries_user_id", "idx_meal_plan_entries_user_date"):
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+        print("✅ idx_meal_plan_entries_user_date_meal is in place")
+
+
+async def downgrade():
+    """Restore 010's user_id indexes and remove the composite."""
+    async with migration_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index in (
+            "idx_meal_plan_entries_user_id ON meal_plan_entries(user_id)",
+            "idx_meal_plan_entries_user_date ON meal_plan_entries(user_id, date)",
+        ):
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}"))
+        await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_meal_plan_entries_user_date_meal"))
+        print("✅ Restored 010's user_id indexes")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "down":
+        asyncio.run(downgrade())
+    else:
+        asyncio.run(upgrade())
@@ -6,12 +6,12 @@ Run with: python -m migrations.012_add_shared_grocery
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def upgrade():
     """Add shared grocery list tables and update grocery_items."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         # Create grocery_lists table
         await conn.execute(text("""
             CREATE TABLE IF NOT EXISTS grocery_lists (
@@ -62,43 +62,25 @@ async def upgrade():
         """))
         
         # Add list_id and added_by_name columns to grocery_items
-        # Check if columns exist first
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'grocery_items' AND column_name = 'list_id';
+        # (IF NOT EXISTS makes re-runs a no-op without a separate probe)
+        await conn.execute(text("""
+            ALTER TABLE grocery_items 
+            ADD COLUMN IF NOT EXISTS list_id UUID REFERENCES grocery_lists(id) ON DELETE CASCADE;
         """))
-        if not result.fetchone():
-            await conn.execute(text("""
-                ALTER TABLE grocery_items 
-                ADD COLUMN list_id UUID REFERENCES grocery_lists(id) ON DELETE CASCADE;
-            """))
-            print("✅ Added list_id column to grocery_items")
+        print("✅ list_id column is in place on grocery_items")
         
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'grocery_items' AND column_name = 'added_by_name';
+        await conn.execute(text("""
+            ALTER TABLE grocery_items 
+            ADD COLUMN IF NOT EXISTS added_by_name VARCHAR(255);
         """))
-        if not result.fetchone():
-            await conn.execute(text("""
-                ALTER TABLE grocery_items 
-                ADD COLUMN added_by_name VARCHAR(255);
-            """))
-            print("✅ Added added_by_name column to grocery_items")
+        print("✅ added_by_name column is in place on grocery_items")
         
         # Add archived column for when user joins a shared list
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'grocery_items' AND column_name = 'archived';
+        await conn.execute(text("""
+            ALTER TABLE grocery_items 
+            ADD COLUMN IF NOT EXISTS archived BOOLEAN DEFAULT FALSE;
         """))
-        if not result.fetchone():
-            await conn.execute(text("""
-                ALTER TABLE grocery_items 
-                ADD COLUMN archived BOOLEAN DEFAULT FALSE;
-            """))
-            print("✅ Added archived column to grocery_items")
+        print("✅ archived column is in place on grocery_items")
         
         # Create index on list_id for fast lookups
         await conn.execute(text("""
@@ -144,7 +126,7 @@ async def upgrade():
 
 async def downgrade():
     """Remove shared grocery list tables and columns."""
-    async with engine.begin() as conn:
+    async with migration_engine.begin() as conn:
         # Remove columns from grocery_items
         await conn.execute(text("""
             ALTER TABLE grocery_items 
@@ -6,46 +6,25 @@ These columns store extraction confidence info to display warnings to users.
 
 import asyncio
 from sqlalchemy import text
-from app.db.database import engine
+from app.db.database import migration_engine
 
 
 async def run_migration():
     """Add low_confidence and confidence_warning columns to extraction_jobs table."""
     
-    async with engine.begin() as conn:
-        # Check if low_confidence column already exists
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'extraction_jobs' AND column_name = 'low_confidence'
+    async with migration_engine.begin() as conn:
+        # IF NOT EXISTS makes re-runs a no-op without a separate probe
+        await conn.execute(text("""
+            ALTER TABLE extraction_jobs
+            ADD COLUMN IF NOT EXISTS low_confidence BOOLEAN DEFAULT FALSE
         """))
+        print("✓ low_confidence column is in place on extraction_jobs")
         
-        if not result.fetchone():
-            # Add the low_confidence column
-            await conn.execute(text("""
-                ALTER TABLE extraction_jobs
-                ADD COLUMN low_confidence BOOLEAN DEFAULT FALSE
-            """))
-            print("✓ Added low_confidence column to extraction_jobs")
-        else:
-            print("✓ low_confidence column already exists")
-        
-        # Check if confidence_warning column already exists
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'extraction_jobs' AND column_name = 'confidence_warning'
+        await conn.execute(text("""
+            ALTER TABLE extraction_jobs
+            ADD COLUMN IF NOT EXISTS confidence_warning TEXT
         """))
-        
-        if not result.fetchone():
-            # Add the confidence_warning column
-            await conn.execute(text("""
-                ALTER TABLE extraction_jobs
-                ADD COLUMN confidence_warning TEXT
-            """))
-            print("✓ Added confidence_warning column to extraction_jobs")
-        else:
-            print("✓ confidence_warning column already exists")
+        print("✓ confidence_warning column is in place on extraction_jobs")
 
 
 if __name__ == "__main__":
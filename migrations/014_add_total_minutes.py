@@ -7,98 +7,274 @@ Enables proper server-side filtering for time-based recipe queries.
 
 import asyncio
 import re
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from sqlalchemy import text
 from app.db.database import engine
 
+# Compiled once for the backfill loop rather than looked up per call.
+# One pattern for both units, so a string is scanned once for hours and minutes.
+# Digits are ASCII [0-9], the same as the SQL pass; \s stays Unicode so scraped
+# times spaced with NBSP or thin spaces ("1\xa0hour") still parse.
+_TIME_RE = re.compile(r'([0-9]+)\s*(hours?|hrs?|h|minutes?|mins?|m(?!onth))')
+_NUM_RE = re.compile(r'([0-9]+)')
 
+# Recipes per backfill transaction (and per streamed/parsed chunk in the
+# Python pass), so no single transaction holds the whole table's row versions
+BACKFILL_CHUNK_SIZE = 5000
+
+
+@lru_cache(maxsize=4096)
 def parse_time_to_minutes(time_str: str) -> int | None:
-    """Parse time string like '30 minutes', '1 hour', '1h 30m' to minutes."""
+    """
+    Parse time string like '30 minutes', '1 hour', '1h 30m' to minutes.
+    
+    Cached because the same few time strings repeat across most recipes.
+    """
     if not time_str:
         return None
     
+    # Bare numbers ("30") are common and need no regex at all. Same digits
+    # as the ASCII patterns (isdecimal() alone also takes e.g. "３０").
+    if time_str.isascii() and time_str.isdecimal():
+        return int(time_str) or None
+    
     time_str = time_str.lower().strip()
-    total_minutes = 0
+    hours = None
+    minutes = None
     
-    # Handle "X hours" or "X hour"
-    hours_match = re.search(r'(\d+)\s*(?:hours?|hrs?|h)', time_str)
-    if hours_match:
-        total_minutes += int(hours_match.group(1)) * 60
+    # Handle "X hours"/"X hrs"/"Xh" and "X minutes"/"X min"/"Xm" in one pass,
+    # keeping the first value seen for each unit
+    for match in _TIME_RE.finditer(time_str):
+        if match.group(2)[0] == 'h':
+            if hours is None:
+                hours = int(match.group(1))
+        elif minutes is None:
+            minutes = int(match.group(1))
+        if hours is not None and minutes is not None:
+            break
     
-    # Handle "X minutes" or "X min"
-    mins_match = re.search(r'(\d+)\s*(?:minutes?|mins?|m(?!onth))', time_str)
-    if mins_match:
-        total_minutes += int(mins_match.group(1))
+    total_minutes = (hours or 0) * 60 + (minutes or 0)
     
     # Handle just a number (assume minutes)
     if total_minutes == 0:
-        num_match = re.search(r'(\d+)', time_str)
+        num_match = _NUM_RE.search(time_str)
         if num_match:
             total_minutes = int(num_match.group(1))
     
     return total_minutes if total_minutes > 0 else None
 
 
+def _int_minutes(value: int) -> int | None:
+    """Minutes from a bare JSON integer (parsed as text, the sign was ignored)."""
+    return abs(value) or None
+
+
+def _float_minutes(value: float) -> int | None:
+    """Minutes from a JSON float, truncated like the leading digits of its text."""
+    # Outside this range str() switches to exponent notation ("1e-05"), whose
+    # leading digits aren't the truncated value
+    if 1e-4 <= abs(value) < 1e16:
+        return int(abs(value)) or None
+    return parse_time_to_minutes(str(value))
+
+
+# Exact-type dispatch, so strings and numbers skip the str() round trip (and
+# bools, an int subclass, still go through str() like any other value)
+_PARSERS_BY_TYPE = {
+    str: parse_time_to_minutes,
+    int: _int_minutes,
+    float: _float_minutes,
+}
+
+
+def _parse_batch(total_times: list) -> list[int | None]:
+    """Parse a chunk of total_time values in a worker process."""
+    parsed = []
+    for total_time in total_times:
+        parse = _PARSERS_BY_TYPE.get(type(total_time))
+        if parse:
+            parsed.append(parse(total_time))
+        else:
+            parsed.append(parse_time_to_minutes(str(total_time)))
+    return parsed
+
+
+async def apply_updates(conn, updates):
+    """COPY (recipe_id, minutes) pairs into a temp table and apply them with one UPDATE."""
+    if not updates:
+        return
+    
+    await conn.execute(text("""
+        CREATE TEMP TABLE tmp_backfill (
+            id UUID PRIMARY KEY,
+            minutes INTEGER NOT NULL
+        ) ON COMMIT DROP
+    """))
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "tmp_backfill", records=updates, columns=["id", "minutes"]
+    )
+    await conn.execute(text("""
+        UPDATE recipes SET total_minutes = t.minutes
+        FROM tmp_backfill t
+        WHERE recipes.id = t.id
+    """))
+
+
 async def run_migration():
     """Add total_minutes column to recipes table and backfill existing data."""
     
     async with engine.begin() as conn:
-        # Check if total_minutes column already exists
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'recipes' AND column_name = 'total_minutes'
+        # IF NOT EXISTS makes re-runs a no-op without a separate probe.
+        # A plain column rather than GENERATED ALWAYS AS (...) STORED: the
+        # routers set total_minutes on insert/update (compute_total_minutes),
+        # which a generated column rejects, and the hours/minutes parse isn't
+        # expressible as one immutable SQL expression for every input (see the
+        # ASCII guard on the SQL pass below).
+        await conn.execute(text("""
+            ALTER TABLE recipes
+            ADD COLUMN IF NOT EXISTS total_minutes INTEGER
         """))
+        print("✓ total_minutes column is in place")
+    
+    # Backfill existing recipes
+    print("\n📊 Backfilling total_minutes for existing recipes...")
+    sql_count = 0
+    python_count = 0
+    
+    # Chunks commit on conn; read_conn holds the Python pass's cursor, which a
+    # commit on its own connection would close
+    async with engine.connect() as conn, engine.connect() as read_conn:
+        # Safe to skip the WAL flush wait: a lost tail of the backfill just
+        # leaves rows NULL, and re-running the migration fills them. SET LOCAL
+        # in each chunk transaction, so the pooled connection goes back as-is.
+        async_commit = text("SET LOCAL synchronous_commit = OFF")
         
-        if not result.fetchone():
-            # Add the total_minutes column with an index
-            await conn.execute(text("""
-                ALTER TABLE recipes
-                ADD COLUMN total_minutes INTEGER
-            """))
-            print("✓ Added total_minutes column to recipes")
+        # Parse in Postgres first, so most rows never leave the database. The
+        # three substrings are the same patterns parse_time_to_minutes uses,
+        # applied the same way (first hours + first minutes, else the first
+        # number; substring() returns the first group, the digits). Only plain
+        # ASCII text without 7+ digit runs is handled here: there Postgres and
+        # Python regexes agree and the result fits an INTEGER. Anything left
+        # NULL goes through Python below.
+        # Chunks walk the table by id, since rows that can't be parsed stay NULL
+        last_id = uuid.UUID(int=0)
+        while True:
+            await conn.execute(async_commit)
+            result = await conn.execute(text(r"""
+                WITH chunk AS (
+                    SELECT id, lower(COALESCE(
+                        NULLIF(extracted->'times'->>'total', ''),
+                        extracted->>'total_time'
+                    )) AS t
+                    FROM recipes
+                    WHERE total_minutes IS NULL AND extracted IS NOT NULL
+                      AND id > CAST(:last_id AS uuid)
+                    ORDER BY id
+                    LIMIT :chunk_size
+                ), parsed AS (
+                    SELECT id, NULLIF(
+                        CASE WHEN hm > 0 THEN hm
+                             ELSE COALESCE(substring(t FROM '([0-9]+)')::numeric, 0)
+                        END, 0) AS minutes
+                    FROM (
+                        SELECT id, t,
+                            COALESCE(substring(t FROM '([0-9]+)\s*(hours?|hrs?|h)')::numeric * 60, 0)
+                            + COALESCE(substring(t FROM '([0-9]+)\s*(minutes?|mins?|m(?!onth))')::numeric, 0) AS hm
+                        FROM chunk
+                        WHERE t ~ '^[ -~]*$' AND t !~ '[0-9]{7}'
+                    ) AS units
+                ), fixed AS (
+                    UPDATE recipes SET total_minutes = parsed.minutes
+                    FROM parsed
+                    WHERE recipes.id = parsed.id AND parsed.minutes IS NOT NULL
+                    RETURNING 1
+                )
+                SELECT (SELECT id FROM chunk ORDER BY id DESC LIMIT 1),
+                       (SELECT count(*) FROM fixed)
+            """), {"last_id": last_id, "chunk_size": BACKFILL_CHUNK_SIZE})
+            chunk_last_id, fixed = result.one()
+            await conn.commit()
             
-            # Create index for faster filtering
-            await conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS ix_recipes_total_minutes 
-                ON recipes (total_minutes)
-            """))
-            print("✓ Created index on total_minutes")
-        else:
-            print("✓ total_minutes column already exists")
+            if chunk_last_id is None:
+                break
+            last_id = chunk_last_id
+            sql_count += fixed
         
-        # Backfill existing recipes
-        print("\n📊 Backfilling total_minutes for existing recipes...")
+        # Stream the recipes the SQL pass couldn't fill, so memory stays
+        # bounded. Rows with no time value at all are filtered out in the
+        # database, and only the two candidate time values come back (still
+        # as decoded JSON), not the whole extracted document.
+        result = await read_conn.stream(
+            text("""
+                SELECT id,
+                       extracted->'times'->'total' AS times_total,
+                       extracted->'total_time' AS total_time
+                FROM recipes
+                WHERE total_minutes IS NULL
+                  AND (NULLIF(extracted->'times'->>'total', '') IS NOT NULL
+                       OR NULLIF(extracted->>'total_time', '') IS NOT NULL)
+            """).execution_options(yield_per=BACKFILL_CHUNK_SIZE)
+        )
         
-        # Fetch all recipes that need backfilling
-        result = await conn.execute(text("""
-            SELECT id, extracted
-            FROM recipes
-            WHERE total_minutes IS NULL AND extracted IS NOT NULL
-        """))
-        rows = result.fetchall()
+        async def write_chunk(recipe_ids, parsed):
+            """Apply one parsed chunk's fixes in its own transaction."""
+            nonlocal python_count
+            updates = [
+                (recipe_id, minutes)
+                for recipe_id, minutes in zip(recipe_ids, await parsed)
+                if minutes
+            ]
+            await conn.execute(async_commit)
+            await apply_updates(conn, updates)
+            await conn.commit()
+            python_count += len(updates)
         
-        updated_count = 0
-        for row in rows:
-            recipe_id = row[0]
-            extracted = row[1]
+        # Regex parsing is CPU-bound, so each streamed chunk is parsed in a
+        # worker process while the next one is fetched. Only the time values
+        # cross the process boundary; recipe ids stay here.
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        with ProcessPoolExecutor() as pool:
+            async for partition in result.partitions():
+                recipe_ids = []
+                total_times = []
+                for recipe_id, times_total, fallback_time in partition:
+                    # Try to get total time from extracted data
+                    total_time = times_total or fallback_time
+                    if total_time:
+                        recipe_ids.append(recipe_id)
+                        total_times.append(total_time)
+                if total_times:
+                    pending.append((recipe_ids, loop.run_in_executor(pool, _parse_batch, total_times)))
+                
+                # Write chunks whose parse has already finished, oldest first
+                while pending and pending[0][1].done():
+                    await write_chunk(*pending.popleft())
             
-            if not extracted:
-                continue
-            
-            # Try to get total time from extracted data
-            times = extracted.get("times") or {}
-            total_time = times.get("total") or extracted.get("total_time")
-            
-            if total_time:
-                minutes = parse_time_to_minutes(str(total_time))
-                if minutes:
-                    await conn.execute(
-                        text("UPDATE recipes SET total_minutes = :minutes WHERE id = :id"),
-                        {"minutes": minutes, "id": recipe_id}
-                    )
-                    updated_count += 1
-        
-        print(f"✓ Backfilled {updated_count} recipes with total_minutes")
+            while pending:
+                await write_chunk(*pending.popleft())
+    
+    print(f"✓ Backfilled {sql_count + python_count} recipes with total_minutes "
+          f"({sql_count} in SQL, {python_count} in Python)")
+    
+    # Create index for faster filtering, after the backfill so it's one sorted
+    # build instead of an index insert per backfilled row. On re-runs it
+    # already exists and IF NOT EXISTS skips it (the backfill then only
+    # touched rows still NULL). CONCURRENTLY doesn't block writes to recipes
+    # while it builds, but can't run inside a transaction. Partial, since the
+    # time filters never match recipes without a total_minutes.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_total_minutes 
+            ON recipes (total_minutes)
+            WHERE total_minutes IS NOT NULL
+        """))
+        print("✓ Index on total_minutes is in place")
 
 
 if __name__ == "__main__":